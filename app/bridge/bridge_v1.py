@@ -2,6 +2,7 @@
 import base64
 import json
 import os
+import threading
 import time
 from typing import List, Dict, Optional
 
@@ -15,6 +16,9 @@ from sentence_transformers import SentenceTransformer
 
 load_dotenv()
 
+LOCAL_INDEX_PATH = "/app/bridge/local_fedramp.index"
+LOCAL_CONTENT_PATH = "/app/bridge/local_fedramp_contents.pkl"
+
 
 class AzureConnector:
     """
@@ -36,6 +40,7 @@ class AzureConnector:
         if not all([self.client_id, self.client_secret, self.app_key]):
             raise ValueError("Missing credentials. Provide them as parameters or environment variables.")
 
+        self._token_lock = threading.Lock()
         self.access_token = self._get_access_token()
         self._configure_openai_client()
         self.context = ""
@@ -64,13 +69,33 @@ class AzureConnector:
         openai.api_version = self.api_version
         openai.api_key = self.access_token
 
+    def _refresh_access_token(self, expired_token: str) -> None:
+        """
+        Fetch a new access token unless another thread already replaced the expired one.
+        """
+        with self._token_lock:
+            if self.access_token == expired_token:
+                self.access_token = self._get_access_token()
+                self._configure_openai_client()
+
+    def _create_chat_completion(self, **kwargs):
+        """
+        Create a chat completion, refreshing the access token once if it has expired.
+        """
+        token = self.access_token
+        try:
+            return openai.ChatCompletion.create(**kwargs)
+        except openai.error.AuthenticationError:
+            self._refresh_access_token(token)
+            return openai.ChatCompletion.create(**kwargs)
+
     def chat(self, input_text: str) -> str:
         """
         Send a message and get a response.
         """
         try:
             user_param = json.dumps({"appkey": self.app_key})
-            response = openai.ChatCompletion.create(
+            response = self._create_chat_completion(
                 deployment_id="gpt-4o",
                 messages=[{"role": "user", "content": input_text}],
                 user=user_param,
@@ -100,10 +125,11 @@ class AzureConnector:
         """
         Load local embeddings and FAISS index.
         """
-        self.index = faiss.read_index(index_path)
+        # The model is set first: process_fedramp_query checks index/embedded_contents.
+        self.embedding_model = SentenceTransformer(model_name)
         with open(content_path, "rb") as f:
             self.embedded_contents = pickle.load(f)
-        self.embedding_model = SentenceTransformer(model_name)
+        self.index = faiss.read_index(index_path)
 
     def retrieve_local_context(self, query: str, top_k: int = 5) -> str:
         """
@@ -121,14 +147,20 @@ class AzureConnector:
         relevant_chunks = [self.embedded_contents[i] for i in indices[0]]
         return "\n\n".join(relevant_chunks)
 
-    def process_fedramp_query(self, question: str, prompt: str, top_k: int = 5) -> str:
+    def process_fedramp_query(self, question: str, prompt: str, top_k: int = 5, return_usage: bool = False):
+        """
+        Answer a question with the local FedRAMP context.
+
+        With return_usage, returns (answer, usage) where usage holds the
+        prompt_tokens and completion_tokens billed for the call.
+        """
 
         try:
             # Load embeddings only if not already loaded
             if not hasattr(self, 'index') or not hasattr(self, 'embedded_contents'):
                 self.load_local_embeddings(
-                    index_path="/app/bridge/local_fedramp.index",
-                    content_path="/app/bridge/local_fedramp_contents.pkl"
+                    index_path=LOCAL_INDEX_PATH,
+                    content_path=LOCAL_CONTENT_PATH
                 )
             relevant_context = self.retrieve_local_context(question, top_k=top_k)
             # print(f"Retrieved context: {relevant_context}")
@@ -144,7 +176,7 @@ class AzureConnector:
             ]
 
             user_param = json.dumps({"appkey": self.app_key})
-            response = openai.ChatCompletion.create(
+            response = self._create_chat_completion(
                 deployment_id="gpt-4o",
                 messages=messages,
                 user=user_param,
@@ -152,7 +184,14 @@ class AzureConnector:
                 max_tokens=2000,
             )
 
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
+            if return_usage:
+                usage = {
+                    "prompt_tokens": response.usage.prompt_tokens,
+                    "completion_tokens": response.usage.completion_tokens,
+                }
+                return answer, usage
+            return answer
 
         except Exception as e:
             raise ValueError(f"Failed to process query: {str(e)}")
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import re
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Numbered lines only count as headings with a multi-level number
+# ("3.1 Access Control"); "1. Install Docker" is a list item.
+HEADING_RE = re.compile(
+    r"^\s*(#{1,6}\s+\S.*"
+    r"|\d+(\.\d+)+\.?\s+[A-Z][\w\-/&]*(\s+([A-Z][\w\-/&]*|and|of|the|for|to|in|on|a|an|or|with)){0,7}"
+    r"|[A-Z][A-Z0-9 ,&/()\-]{2,80})\s*$"
+)
+TABLE_RE = re.compile(r"\||\t")
+COLUMN_GAP_RE = re.compile(r"\S {2,}(?=\S)")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+RECORDS_FORMAT = "records"
+
+
+def whitespace_token_counter(text: str) -> int:
+    return len(text.split())
+
+
+def tokenizer_token_counter(tokenizer) -> Callable[[str], int]:
+    """Builds a token counter from a HuggingFace tokenizer."""
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return count
+
+
+def chunk_id(source: str, start: int, text: str) -> str:
+    """Deterministic ID built from the source, the offset and the content hash."""
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{source}:{start}:{content_hash}".encode("utf-8")).hexdigest()[:32]
+
+
+def _column_starts(line: str) -> set:
+    """Offsets where a column starts after a run of two or more spaces."""
+    return {m.end() for m in COLUMN_GAP_RE.finditer(line)}
+
+
+def _aligned_columns(lines: List[str]) -> List[bool]:
+    """
+    Flags lines that look like rows of a space-aligned table.
+
+    A line needs at least two column starts in common with an adjacent line, so
+    prose with stray double spaces (after a period, or justified PDF text) is
+    not mistaken for a table.
+    """
+    columns = [_column_starts(line) for line in lines]
+    aligned = []
+    for i, starts in enumerate(columns):
+        neighbours = [columns[j] for j in (i - 1, i + 1) if 0 <= j < len(columns)]
+        aligned.append(any(len(starts & other) >= 2 for other in neighbours))
+    return aligned
+
+
+def _line_kind(line: str, records: bool, aligned: bool = False) -> str:
+    if not line.strip():
+        return "blank"
+    if records:
+        return "record"
+    if aligned or TABLE_RE.search(line):
+        return "table"
+    if HEADING_RE.match(line) and not line.rstrip().endswith((".", ",", ";")):
+        return "heading"
+    return "text"
+
+
+def split_blocks(text: str, records: bool = False) -> List[Tuple[str, int, int]]:
+    """
+    Splits text into structural blocks: headings, paragraphs, tables and records.
+
+    Returns a list of (kind, start, end) spans over the original text. Consecutive
+    table lines are kept in a single block, each record is a block of its own.
+    """
+    blocks = []
+    current_kind, current_start, current_end = None, 0, 0
+    offset = 0
+    lines = text.splitlines(keepends=True)
+    aligned = [False] * len(lines) if records else _aligned_columns(lines)
+    for line, line_aligned in zip(lines, aligned):
+        kind = _line_kind(line, records, line_aligned)
+        line_end = offset + len(line.rstrip("\r\n"))
+        if kind in ("blank", "heading", "record") or kind != current_kind:
+            if current_kind:
+                blocks.append((current_kind, current_start, current_end))
+                current_kind = None
+            if kind == "heading" or kind == "record":
+                blocks.append((kind, offset, line_end))
+            elif kind != "blank":
+                current_kind, current_start = kind, offset
+        if current_kind:
+            current_end = line_end
+        offset += len(line)
+    if current_kind:
+        blocks.append((current_kind, current_start, current_end))
+    return blocks
+
+
+class StructuredChunker:
+    """
+    Packs structural blocks into chunks sized by embedding-model tokens.
+
+    Blocks are never split unless a single block exceeds the budget: tables and
+    records are then split on row boundaries, paragraphs on sentences. Each chunk
+    is prefixed with its section heading and carries a stable ID and source span.
+    """
+
+    def __init__(self, token_counter: Optional[Callable[[str], int]] = None, chunk_tokens: int = 256):
+        self.count_tokens = token_counter or whitespace_token_counter
+        self.chunk_tokens = chunk_tokens
+        self.max_prefix_tokens = chunk_tokens // 4
+
+    def _prefix(self, section: str) -> str:
+        """
+        The section heading repeated on each chunk, cut to a quarter of the budget
+        so a long heading or a wide CSV header still leaves room for content.
+        """
+        if not section or self.count_tokens(section) <= self.max_prefix_tokens:
+            return section
+
+        words = section.split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(" ".join(words[:middle])) <= self.max_prefix_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low])
+
+    def _pieces(self, text: str, kind: str, start: int, end: int, budget: int) -> Iterable[Tuple[int, int]]:
+        """Yields spans no larger than the token budget for a single block."""
+        if self.count_tokens(text[start:end]) <= budget:
+            yield start, end
+            return
+
+        pattern = re.compile(r"\n") if kind == "table" else SENTENCE_RE
+        cuts = [start] + [start + m.end() for m in pattern.finditer(text[start:end])] + [end]
+        spans = []
+        for a, b in zip(cuts, cuts[1:]):
+            if not text[a:b].strip():
+                continue
+            if self.count_tokens(text[a:b]) > budget:
+                # Row or sentence still too large, fall back to word boundaries.
+                spans.extend((a + m.start(), a + m.end()) for m in re.finditer(r"\S+\s*", text[a:b]))
+            else:
+                spans.append((a, b))
+
+        piece_start, piece_end = spans[0]
+        for span_start, span_end in spans[1:]:
+            if self.count_tokens(text[piece_start:span_end]) > budget:
+                yield piece_start, piece_end
+                piece_start = span_start
+            piece_end = span_end
+        yield piece_start, piece_end
+
+    def split_text(self, text: str, records: bool = False, header: str = "") -> List[dict]:
+        """
+        Splits a single text into chunks.
+
+        Returns dicts with the chunk ``text``, its ``start``/``end`` offsets in the
+        source text and the ``section`` heading it belongs to.
+        """
+        chunks = []
+        section = header
+        prefix = self._prefix(section)
+        span_start, span_end = None, None
+
+        def flush():
+            if span_start is None:
+                return
+            body = text[span_start:span_end].strip()
+            chunk_prefix = f"{prefix}\n" if prefix and not body.startswith(prefix) else ""
+            chunks.append({"text": chunk_prefix + body, "start": span_start, "end": span_end, "section": section})
+
+        for kind, start, end in split_blocks(text, records=records):
+            if kind == "heading":
+                flush()
+                span_start = None
+                section = text[start:end].strip()
+                prefix = self._prefix(section)
+                continue
+
+            # The prefix is prepended to every chunk, so it comes out of the budget.
+            budget = self.chunk_tokens - self.count_tokens(f"{prefix}\n") if prefix else self.chunk_tokens
+            for piece_start, piece_end in self._pieces(text, kind, start, end, max(1, budget)):
+                if span_start is not None:
+                    candidate = f"{prefix}\n{text[span_start:piece_end]}" if prefix else text[span_start:piece_end]
+                    if self.count_tokens(candidate) > self.chunk_tokens:
+                        flush()
+                        span_start = None
+                if span_start is None:
+                    span_start = piece_start
+                span_end = piece_end
+        flush()
+        return chunks
+
+    def split_documents(self, documents: List[Document]) -> Tuple[List[Document], List[str]]:
+        """Splits documents and returns the chunks together with their stable IDs."""
+        docs, ids, seen = [], [], set()
+        for document in documents:
+            metadata = document.metadata
+            source = os.path.abspath(metadata.get("source", ""))
+            if "page" in metadata:
+                source = f"{source}#page={metadata['page']}"
+            records = metadata.get("format") == RECORDS_FORMAT
+            for chunk in self.split_text(document.page_content, records=records, header=metadata.get("header", "")):
+                identifier = chunk_id(source, chunk["start"], chunk["text"])
+                if identifier in seen:
+                    continue
+                seen.add(identifier)
+                ids.append(identifier)
+                docs.append(Document(
+                    page_content=chunk["text"],
+                    metadata={
+                        **metadata,
+                        "chunk_id": identifier,
+                        "start_index": chunk["start"],
+                        "end_index": chunk["end"],
+                        "section": chunk["section"],
+                    },
+                ))
+        return docs, ids
@@ -153,17 +153,26 @@ prompts = [
 ]
 
 
+def split_shards(initial_data):
+    return initial_data.split('--')
+
+
+def ask_shard(model, data, ai_model, prompt, return_usage=False):
+    """With return_usage, returns (answer, usage); usage is None for the internal model."""
+    if ai_model == 'internal':
+        answer = f'{model.ask(prompt + data)}'
+        return (answer, None) if return_usage else answer
+    return model.process_fedramp_query(data, prompt, return_usage=return_usage)
+
+
 def shard_asking(model, initial_data, ai_model, prompt):
-    initial_data = initial_data.split('--')
+    initial_data = split_shards(initial_data)
     answers = ''
 
     answers += f'Prompt used:\n\n{prompt}\n\n'
     for i, data in enumerate(initial_data):
         print(f'Asking model, iteration {i + 1}')
-        if ai_model == 'internal':
-            answers += f'{model.ask(prompt + data)}' + '\n'
-        else:
-            answers += model.process_fedramp_query(data, prompt) + '\n'
+        answers += ask_shard(model, data, ai_model, prompt) + '\n'
 
     return answers
 
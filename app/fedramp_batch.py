@@ -0,0 +1,215 @@
+"""
+Offline bulk FedRAMP compliance report runner.
+
+Runs every prompt template against every shard of every infrastructure
+description and appends one JSON line per answer to the output file. Finished
+calls are read back from the output on start, so a crashed run resumes where it
+stopped. Example:
+
+    python fedramp_batch.py --input ../requests.jsonl --output reports.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+import tiktoken
+
+from confluence_bot_app import prompts, split_shards, ask_shard
+
+INPUT_EXTENSIONS = ("txt", "md")
+
+
+def load_items(input_path: str, id_field: str = "request_id", text_field: str = "body") -> List[Dict[str, str]]:
+    """
+    Loads infrastructure descriptions from a directory of text files or a JSONL file.
+    """
+    items = []
+    if os.path.isdir(input_path):
+        for extension in INPUT_EXTENSIONS:
+            for file in sorted(glob.glob(f"{input_path}/**/*.{extension}", recursive=True)):
+                with open(file, encoding="utf-8") as f:
+                    items.append({"id": os.path.relpath(file, input_path), "text": f.read()})
+    elif os.path.isfile(input_path):
+        with open(input_path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = record.get(text_field)
+                if not text:
+                    raise ValueError(f"Line {line_number} has no '{text_field}' field.")
+                items.append({"id": str(record.get(id_field, line_number)), "text": text})
+    else:
+        raise FileNotFoundError(f"Input not found: {input_path}")
+
+    if not items:
+        raise ValueError("No infrastructure descriptions found.")
+    return items
+
+
+def load_checkpoint(output_path: str) -> Set[Tuple[str, int, int]]:
+    """Returns the (item, prompt, shard) keys already answered in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            # Drop a line torn by a crash so new records are not appended onto it.
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+
+    for line in data.decode("utf-8").splitlines():
+        record = json.loads(line)
+        done.add((record["item_id"], record["prompt_index"], record["shard_index"]))
+    return done
+
+
+async def run_batch(model, ai_model: str, items: List[Dict[str, str]], output_path: str,
+                    concurrency: int = 4, input_cost: float = 0.0, output_cost: float = 0.0) -> Dict:
+    """
+    Answers every prompt x shard of every item with bounded concurrency.
+
+    Costs are in USD per million tokens. Azure calls are counted from the token
+    usage the API reports; the internal model reports none, so its tokens are a
+    tiktoken estimate of the prompt and shard text.
+    """
+    encoding = tiktoken.get_encoding("cl100k_base")
+    done = load_checkpoint(output_path)
+    # Blank shards (leading or doubled "--") would be paid calls with nothing to
+    # analyze; the original shard index is kept so checkpoints stay valid.
+    tasks = [
+        (item, prompt_index, shard_index, shard)
+        for item in items
+        for prompt_index, prompt in enumerate(prompts)
+        for shard_index, shard in enumerate(split_shards(item["text"]))
+        if shard.strip()
+    ]
+    pending = [task for task in tasks if (task[0]["id"], task[1], task[2]) not in done]
+    print(f"[Batch] {len(tasks)} calls, {len(tasks) - len(pending)} already done, {len(pending)} to run")
+
+    stats = {"completed": 0, "failed": 0, "input_tokens": 0, "output_tokens": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    started = time.monotonic()
+
+    with open(output_path, "a", encoding="utf-8") as output:
+        async def run_one(item, prompt_index, shard_index, shard):
+            prompt = prompts[prompt_index]
+            async with semaphore:
+                call_started = time.monotonic()
+                try:
+                    answer, usage = await asyncio.to_thread(
+                        ask_shard, model, shard, ai_model, prompt, return_usage=True
+                    )
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"[Batch] Failed {item['id']} prompt {prompt_index} shard {shard_index}: {e}")
+                    return
+                latency = time.monotonic() - call_started
+
+            if usage:
+                input_tokens, output_tokens = usage["prompt_tokens"], usage["completion_tokens"]
+            else:
+                input_tokens = len(encoding.encode(prompt + shard))
+                output_tokens = len(encoding.encode(answer))
+            record = {
+                "item_id": item["id"],
+                "prompt_index": prompt_index,
+                "shard_index": shard_index,
+                "shard": shard,
+                "answer": answer,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "tokens_estimated": usage is None,
+                "latency_s": round(latency, 3),
+            }
+            async with write_lock:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                os.fsync(output.fileno())
+            stats["completed"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            if stats["completed"] % 50 == 0:
+                print(f"[Batch] {stats['completed']}/{len(pending)} calls done")
+
+        await asyncio.gather(*(run_one(*task) for task in pending))
+
+    elapsed = time.monotonic() - started
+    stats.update({
+        "skipped": len(tasks) - len(pending),
+        "elapsed_s": round(elapsed, 3),
+        "calls_per_s": round(stats["completed"] / elapsed, 3) if elapsed else 0.0,
+        "tokens_per_s": round((stats["input_tokens"] + stats["output_tokens"]) / elapsed, 3) if elapsed else 0.0,
+        "estimated_cost_usd": round(
+            (stats["input_tokens"] * input_cost + stats["output_tokens"] * output_cost) / 1_000_000, 6
+        ),
+    })
+    return stats
+
+
+def write_parquet(output_path: str, parquet_path: str) -> None:
+    import pandas as pd
+
+    pd.read_json(output_path, lines=True, dtype={"item_id": str}).to_parquet(parquet_path, index=False)
+    print(f"[Batch] Parquet written to {parquet_path}")
+
+
+def build_model(ai_model: str):
+    if ai_model == "internal":
+        from rag_gema3 import RAGModel
+
+        rag = RAGModel()
+        if not rag.refresh():
+            raise ValueError("No trained index found, run /train first.")
+        return rag
+
+    from bridge.bridge_v1 import AzureConnector, LOCAL_INDEX_PATH, LOCAL_CONTENT_PATH
+
+    connector = AzureConnector()
+    # Load once up front, the lazy load in process_fedramp_query is not safe
+    # under concurrent calls.
+    connector.load_local_embeddings(index_path=LOCAL_INDEX_PATH, content_path=LOCAL_CONTENT_PATH)
+    return connector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk FedRAMP High compliance report runner.")
+    parser.add_argument("--input", required=True, help="Directory of .txt/.md files or a JSONL file")
+    parser.add_argument("--output", required=True, help="JSONL results file, also used as the checkpoint")
+    parser.add_argument("--parquet", help="Also write the results as Parquet to this path")
+    parser.add_argument("--ai-model", default="azure", help="'internal' for the local RAG model, anything else for Azure")
+    parser.add_argument("--id-field", default="request_id")
+    parser.add_argument("--text-field", default="body")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--input-cost", type=float, default=0.0, help="USD per million input tokens")
+    parser.add_argument("--output-cost", type=float, default=0.0, help="USD per million output tokens")
+    args = parser.parse_args()
+
+    items = load_items(args.input, args.id_field, args.text_field)
+    model = build_model(args.ai_model)
+    stats = asyncio.run(run_batch(
+        model, args.ai_model, items, args.output,
+        concurrency=args.concurrency, input_cost=args.input_cost, output_cost=args.output_cost
+    ))
+
+    if args.parquet:
+        write_parquet(args.output, args.parquet)
+
+    with open(f"{args.output}.summary.json", "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+    print(f"[Report] {json.dumps(stats)}")
+
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
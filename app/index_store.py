@@ -0,0 +1,84 @@
+import fcntl
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".writer.lock"
+GENERATION_PREFIX = "gen-"
+
+
+class IndexGenerations:
+    """
+    Immutable, versioned index directories shared between worker processes.
+
+    A single writer (serialized with a file lock) builds every new index into a
+    fresh ``gen-*`` directory and publishes it by atomically replacing the
+    ``CURRENT`` pointer. Readers only ever open published generations, so they
+    never see a half-written index and can cheaply poll the pointer to reload.
+    """
+
+    def __init__(self, root: str = "chroma_db", keep: int = 2):
+        self.root = root
+        self.keep = keep
+        os.makedirs(self.root, exist_ok=True)
+
+    def current(self) -> Optional[str]:
+        """Returns the directory of the published generation, if any."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.root, name) if name else None
+
+    @contextmanager
+    def writer(self, copy_current: bool = False) -> Iterator[str]:
+        """
+        Yields a new generation directory to build into and publishes it on exit.
+
+        With ``copy_current`` the new generation starts as a copy of the current
+        one, so the caller can add to it instead of rebuilding from scratch.
+        The generation is discarded if the block raises.
+        """
+        with open(os.path.join(self.root, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                name = f"{GENERATION_PREFIX}{time.time_ns()}"
+                path = os.path.join(self.root, name)
+                current = self.current()
+                if copy_current and current and os.path.isdir(current):
+                    shutil.copytree(current, path)
+                else:
+                    os.makedirs(path)
+
+                try:
+                    yield path
+                except BaseException:
+                    shutil.rmtree(path, ignore_errors=True)
+                    raise
+
+                self._publish(name)
+                self._prune()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _publish(self, name: str) -> None:
+        tmp_path = os.path.join(self.root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+        print(f"[Index] Published generation {name}")
+
+    def _prune(self) -> None:
+        """Removes old generations, keeping the newest ``keep`` for readers still attached."""
+        generations = sorted(
+            name for name in os.listdir(self.root)
+            if name.startswith(GENERATION_PREFIX) and os.path.isdir(os.path.join(self.root, name))
+        )
+        for name in generations[:-self.keep]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
@@ -1,10 +1,14 @@
-from fastapi import FastAPI, UploadFile, File, Query, HTTPException
-import shutil
+from fastapi import FastAPI, UploadFile, File, Query, HTTPException, BackgroundTasks
+from fastapi.responses import JSONResponse
 import os
 
 from confluence_bot_app import run_program
 from bridge.bridge_v1 import AzureConnector
-from rag_gema3 import RAGModel, custom_prompt
+from rag_gema3 import RAGModel, custom_prompt, SUPPORTED_EXTENSIONS
+from uploads import (
+    MAX_ARCHIVE_BYTES, MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES,
+    UploadTooLarge, store_stream, expand_archive, forget_file, set_indexed, safe_path
+)
 
 app = FastAPI()
 rag = RAGModel()
@@ -12,34 +16,147 @@ rag = RAGModel()
 DATA_DIR = "../data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+UPLOAD_LIMITS = {
+    "/upload-data": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    "/upload-archive": MAX_ARCHIVE_BYTES + MULTIPART_OVERHEAD_BYTES,
+}
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Bounds upload request bodies before Starlette spools them.
+
+    Requests whose Content-Length is over the limit are refused up front;
+    chunked requests are counted as they arrive and cut off with a 413 once
+    they pass it.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Upload exceeds the {limit} byte limit"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadSizeLimitMiddleware, limits=UPLOAD_LIMITS)
+
+
+def index_queued_files():
+    indexed = rag.index_pending()
+    if indexed:
+        set_indexed(DATA_DIR, [os.path.relpath(file, DATA_DIR) for file in indexed])
+
+
+def queue_indexing(background_tasks: BackgroundTasks, results):
+    new_files = [
+        os.path.join(DATA_DIR, result["filename"])
+        for result in results
+        if result["status"] in ("uploaded", "duplicate")
+        and not result["indexed"]
+        and result["filename"].lower().endswith(SUPPORTED_EXTENSIONS)
+    ]
+    if new_files:
+        rag.queue_files(new_files)
+        background_tasks.add_task(index_queued_files)
+    return len(new_files)
+
+
 @app.post("/upload-data")
-def upload_data(file: UploadFile = File(...)):
-    file_path = os.path.join(DATA_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"status": "uploaded", "filename": file.filename}
+def upload_data(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    index: bool = Query(False, description="Index the file right away unless its content already is"),
+):
+    try:
+        result = store_stream(file.file, file.filename, DATA_DIR)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if index:
+        result["queued_for_indexing"] = queue_indexing(background_tasks, [result]) > 0
+    return result
+
+
+@app.post("/upload-archive")
+def upload_archive(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    index: bool = Query(False, description="Index the new files right away"),
+):
+    if not file.filename.lower().endswith((".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")):
+        raise HTTPException(status_code=400, detail="Expected a .zip or .tar archive")
+
+    try:
+        results = expand_archive(file.file, file.filename, DATA_DIR, SUPPORTED_EXTENSIONS)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response = {
+        "status": "expanded",
+        "archive": file.filename,
+        "uploaded": sum(result["status"] == "uploaded" for result in results),
+        "duplicates": sum(result["status"] == "duplicate" for result in results),
+        "files": results,
+    }
+    if index:
+        response["queued_for_indexing"] = queue_indexing(background_tasks, results)
+    return response
 
 
 @app.delete("/delete-file")
 def delete_file(filename: str = Query(...)):
-    file_path = os.path.join(DATA_DIR, filename)
+    try:
+        file_path = safe_path(DATA_DIR, filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
     os.remove(file_path)
+    forget_file(DATA_DIR, filename)
     return {"status": "deleted", "filename": filename}
 
 
 @app.get("/files")
 def list_uploaded_files():
-    files = os.listdir(DATA_DIR)
+    files = [name for name in os.listdir(DATA_DIR) if not name.startswith(".")]
     return {"files": files}
 
 
 @app.post("/train")
 def train_model():
-    rag.load_and_index_documents(DATA_DIR)
+    indexed = rag.load_and_index_documents(DATA_DIR)
     rag.setup_qa_chain(custom_prompt)
+    # The rebuild replaces the index, so it defines what counts as indexed;
+    # duplicates skipped while loading share a hash with an indexed file.
+    set_indexed(DATA_DIR, [os.path.relpath(file, DATA_DIR) for file in indexed], replace=True)
     return {"status": "training complete"}
 
 
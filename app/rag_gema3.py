@@ -1,23 +1,52 @@
 import csv
 import glob
+import hashlib
 import os
-import tempfile
+import threading
+import time
 
+from langchain_core.documents import Document
 from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredWordDocumentLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_community.llms import Ollama
 from langchain.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
 
+from chunking import RECORDS_FORMAT, StructuredChunker, tokenizer_token_counter
+from index_store import IndexGenerations
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf', '.docx', '.csv')
+INDEX_DEBOUNCE_SECONDS = float(os.getenv("INDEX_DEBOUNCE_SECONDS", 2))
+
+def unique_content(files):
+    """
+    Drops files whose content duplicates an earlier file in the list, so
+    hard-linked or re-uploaded copies are embedded only once.
+    """
+    seen = set()
+    unique = []
+    for file in files:
+        digest = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        if digest.hexdigest() not in seen:
+            seen.add(digest.hexdigest())
+            unique.append(file)
+    if len(unique) < len(files):
+        print(f"[Load] Skipping {len(files) - len(unique)} duplicate file(s)")
+    return unique
+
+
 class RAGModel:
     def __init__(
             self,
             model_name='gemma3',
             embedding_model='nomic-ai/nomic-embed-text-v1',
             persist_dir='chroma_db',
-            temperature = 0.2
+            temperature = 0.2,
+            chunk_tokens=256
 
     ):
         self.temperature = temperature
@@ -27,95 +56,234 @@ class RAGModel:
             model_kwargs={"trust_remote_code": True}
         )
         self.persist_dir = persist_dir
+        self.generations = IndexGenerations(persist_dir)
+        self.generation = None
+        self.chunker = StructuredChunker(
+            token_counter=tokenizer_token_counter(self.embedding_model.client.tokenizer),
+            chunk_tokens=chunk_tokens
+        )
         self.vectorstore = None
         self.qa_chain = None
+        self.prompt = None
+        self._pending_files = set()
+        self._pending_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        # Guards swapping the attached vectorstore/QA chain; asks count as users
+        # of a store so a retired one is only stopped once they are done with it.
+        self._switch_lock = threading.RLock()
+        self._store_users = {}
+        self._retired = {}
         print("[Init] Initialized RAG with Gemma 3 + HuggingFace Embeddings")
 
-    def load_and_index_documents(self, folder_path='data'):
-        print("[Load] Reading documents...")
-
+    def load_documents(self, files):
         loaders = []
+        csv_docs = []
+        for file in files:
+            extension = os.path.splitext(file)[1].lower()
+            if extension == '.txt':
+                loaders.append(TextLoader(file))
+            elif extension == '.pdf':
+                loaders.append(PyPDFLoader(file))
+            elif extension == '.docx':
+                loaders.append(UnstructuredWordDocumentLoader(file))
+            elif extension == '.csv':
+                if not os.path.exists(file):
+                    raise FileNotFoundError(f"CSV file not found: {file}")
 
-        txt_files = glob.glob(f"{folder_path}/**/*.txt", recursive=True)
-        for file in txt_files:
-            loaders.append(TextLoader(file))
-
-        pdf_files = glob.glob(f"{folder_path}/**/*.pdf", recursive=True)
-        for file in pdf_files:
-            loaders.append(PyPDFLoader(file))
-
-        docx_files = glob.glob(f"{folder_path}/**/*.docx", recursive=True)
-        for file in docx_files:
-            loaders.append(UnstructuredWordDocumentLoader(file))
-
-        csv_files = glob.glob(f"{folder_path}/**/*.csv", recursive=True)
-        for file in csv_files:
-            if os.path.exists(file):
                 with open(file, newline='', encoding='utf-8') as csvfile:
                     reader = csv.reader(csvfile)
-                    rows = list(reader)
-
-                    text = "\n".join([", ".join(row) for row in rows])
-
-                    with tempfile.NamedTemporaryFile(delete=False, mode='w', encoding='utf-8') as tmpfile:
-                        tmpfile.write(text)
-                        tmpfile_path = tmpfile.name
+                    rows = [", ".join(" ".join(cell.split()) for cell in row) for row in reader]
 
-                    loaders.append(TextLoader(tmpfile_path))
-
-            else:
-                raise FileNotFoundError(f"CSV file not found: {file}")
-        if not loaders:
+                if rows:
+                    csv_docs.append(Document(
+                        page_content="\n".join(rows[1:]),
+                        metadata={"source": file, "format": RECORDS_FORMAT, "header": rows[0]}
+                    ))
+        if not loaders and not csv_docs:
             raise ValueError("No supported documents found.")
 
-        raw_docs = []
+        raw_docs = list(csv_docs)
         for loader in loaders:
             raw_docs.extend(loader.load())
 
         print(f"[Docs] Loaded {len(raw_docs)} raw documents")
+        return raw_docs
 
+    def split_documents(self, raw_docs):
         print("[Split] Splitting documents...")
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        docs = splitter.split_documents(raw_docs)
+        docs, ids = self.chunker.split_documents(raw_docs)
 
         if not docs:
             raise ValueError("No text chunks found after splitting.")
+        return docs, ids
+
+    def load_and_index_documents(self, folder_path='data'):
+        print("[Load] Reading documents...")
+
+        files = []
+        for extension in SUPPORTED_EXTENSIONS:
+            files.extend(glob.glob(f"{folder_path}/**/*{extension}", recursive=True))
+        files = unique_content(sorted(files))
+
+        docs, ids = self.split_documents(self.load_documents(files))
 
         print(f"[Embed] Embedding {len(docs)} chunks...")
-        self.vectorstore = Chroma.from_documents(
-            documents=docs,
-            embedding=self.embedding_model,
-            persist_directory=self.persist_dir
-        )
-        self.vectorstore.persist()
+        with self.generations.writer() as generation:
+            vectorstore = Chroma.from_documents(
+                documents=docs,
+                ids=ids,
+                embedding=self.embedding_model,
+                persist_directory=generation
+            )
+            vectorstore.persist()
+        self._attach(vectorstore, generation)
         print("[Persist] Vectorstore saved to disk.")
+        return files
+
+    def index_files(self, files):
+        """
+        Adds the given files to a copy of the current index and publishes it,
+        without re-embedding anything already indexed. Chunks of an earlier
+        version of any of the files are removed first.
+        """
+        print(f"[Load] Indexing {len(files)} new file(s)...")
+        docs, ids = self.split_documents(self.load_documents(unique_content(files)))
+
+        print(f"[Embed] Embedding {len(docs)} chunks...")
+        with self.generations.writer(copy_current=True) as generation:
+            vectorstore = Chroma(
+                embedding_function=self.embedding_model,
+                persist_directory=generation
+            )
+            for file in files:
+                vectorstore._collection.delete(where={"source": file})
+            vectorstore.add_documents(docs, ids=ids)
+        self._attach(vectorstore, generation)
+        print("[Persist] Vectorstore saved to disk.")
+
+    def queue_files(self, files):
+        """Adds files to the batch picked up by the next index_pending run."""
+        with self._pending_lock:
+            self._pending_files.update(files)
+
+    def index_pending(self):
+        """
+        Indexes every queued file as a single new generation.
+
+        Waits INDEX_DEBOUNCE_SECONDS so a burst of uploads lands in one batch;
+        runs queued behind a batch in progress find the queue already drained
+        and return. Returns the files that were indexed.
+        """
+        time.sleep(INDEX_DEBOUNCE_SECONDS)
+        with self._index_lock:
+            with self._pending_lock:
+                files = sorted(self._pending_files)
+                self._pending_files.clear()
+            if not files:
+                return []
+
+            self.index_files(files)
+            return files
+
+    def _attach(self, vectorstore, generation):
+        """
+        Swaps in a fully built vectorstore and its QA chain, retiring the previous store.
+
+        Callers build the new generation first, so asks keep using the old one
+        until the swap instead of seeing a half-switched model.
+        """
+        with self._switch_lock:
+            if generation == self.generation:
+                # Another thread already attached this generation and shares its system.
+                return
+
+            previous = self.vectorstore
+            self.vectorstore = vectorstore
+            self.generation = generation
+            self.setup_qa_chain(self.prompt or custom_prompt)
+            if previous is not None:
+                self._retire(previous)
+
+    def _retire(self, vectorstore):
+        """Stops a detached store now, or once the last ask still using it is done."""
+        if vectorstore._client._system is self.vectorstore._client._system:
+            return
+        if self._store_users.get(id(vectorstore)):
+            self._retired[id(vectorstore)] = vectorstore
+        else:
+            self._stop(vectorstore)
+
+    @staticmethod
+    def _stop(vectorstore):
+        """
+        Stops the Chroma system of a detached store and drops it from chromadb's
+        per-path cache, which otherwise keeps every generation ever attached open
+        for the life of the process.
+        """
+        client = vectorstore._client
+        client._system.stop()
+        client._identifier_to_system.pop(client._identifier, None)
 
     def load_vectorstore(self):
-        print("[Load] Loading vectorstore from disk...")
-        self.vectorstore = Chroma(
+        generation = self.generations.current()
+        if not generation:
+            raise ValueError("No published index generation found.")
+
+        print(f"[Load] Loading vectorstore generation {generation}...")
+        vectorstore = Chroma(
             embedding_function=self.embedding_model,
-            persist_directory=self.persist_dir
+            persist_directory=generation
         )
+        self._attach(vectorstore, generation)
+
+    def refresh(self) -> bool:
+        """
+        Reattaches to the published index generation if another process replaced it.
+
+        Returns True when the vectorstore and QA chain were reloaded.
+        """
+        with self._switch_lock:
+            current = self.generations.current()
+            if not current or current == self.generation:
+                return False
+
+            self.load_vectorstore()
+            return True
 
     def setup_qa_chain(self, prompt: PromptTemplate):
         if not self.vectorstore:
             raise ValueError("Vectorstore is not initialized.")
 
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
-        llm = Ollama(model=self.model_name, temperature=self.temperature)
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            retriever=retriever,
-            chain_type="stuff",
-            chain_type_kwargs={"prompt": prompt}
-        )
+        with self._switch_lock:
+            retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
+            llm = Ollama(model=self.model_name, temperature=self.temperature)
+            self.qa_chain = RetrievalQA.from_chain_type(
+                llm=llm,
+                retriever=retriever,
+                chain_type="stuff",
+                chain_type_kwargs={"prompt": prompt}
+            )
+            self.prompt = prompt
         print("[Chain] QA Chain ready.")
 
     def ask(self, question: str) -> str:
-        if not self.qa_chain:
-            raise ValueError("QA chain not initialized.")
-        print(f"[Ask] {question}")
-        return self.qa_chain.run(question)
+        with self._switch_lock:
+            self.refresh()
+            qa_chain, vectorstore = self.qa_chain, self.vectorstore
+            if not qa_chain:
+                raise ValueError("QA chain not initialized.")
+            self._store_users[id(vectorstore)] = self._store_users.get(id(vectorstore), 0) + 1
+
+        try:
+            print(f"[Ask] {question}")
+            return qa_chain.run(question)
+        finally:
+            with self._switch_lock:
+                users = self._store_users.pop(id(vectorstore)) - 1
+                if users:
+                    self._store_users[id(vectorstore)] = users
+                elif id(vectorstore) in self._retired:
+                    self._stop(self._retired.pop(id(vectorstore)))
 
 
 custom_prompt = PromptTemplate.from_template("""
@@ -0,0 +1,243 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+MAX_ARCHIVE_BYTES = int(os.getenv("MAX_ARCHIVE_BYTES", 1024 * 1024 * 1024))
+# Room for the multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+HASH_INDEX_FILE = ".hashes.json"
+HASH_LOCK_FILE = ".hashes.lock"
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def safe_path(data_dir: str, filename: str) -> str:
+    """Resolves an uploaded or archived name inside data_dir, rejecting traversal."""
+    name = os.path.normpath(filename.replace("\\", "/")).lstrip("/")
+    if not name or name == "." or name.startswith("..") or os.path.basename(name).startswith("."):
+        raise ValueError(f"Invalid filename: {filename}")
+    return os.path.join(data_dir, name)
+
+
+class _HashIndex:
+    """
+    The dedupe index of a data dir.
+
+    ``files`` maps every stored name to the sha256 of its content, ``names``
+    is the reverse map used for lookups and ``indexed`` holds the hashes
+    currently embedded into the vector index.
+    """
+
+    def __init__(self, files: Dict[str, str], indexed: Iterable[str]):
+        self.files = files
+        self.indexed = set(indexed)
+        self.names = {}
+        for name, sha256 in files.items():
+            self.names.setdefault(sha256, set()).add(name)
+
+    def existing(self, data_dir: str, sha256: str) -> Optional[str]:
+        """A stored name holding this content, if any is still on disk."""
+        for name in sorted(self.names.get(sha256, ())):
+            if os.path.isfile(os.path.join(data_dir, name)):
+                return name
+        return None
+
+    def add(self, name: str, sha256: str) -> None:
+        self.remove(name)
+        self.files[name] = sha256
+        self.names.setdefault(sha256, set()).add(name)
+
+    def remove(self, name: str) -> None:
+        """Forgets a name; content no name references any more is no longer indexed."""
+        sha256 = self.files.pop(name, None)
+        if sha256 is None:
+            return
+        self.names[sha256].discard(name)
+        if not self.names[sha256]:
+            del self.names[sha256]
+            self.indexed.discard(sha256)
+
+
+@contextmanager
+def _hash_index(data_dir: str) -> Iterator[_HashIndex]:
+    """Locks and yields the dedupe index of data_dir, saving it once on exit."""
+    with open(os.path.join(data_dir, HASH_LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            index_path = os.path.join(data_dir, HASH_INDEX_FILE)
+            try:
+                with open(index_path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = {}
+            if "files" not in data:
+                # Earlier sha256 -> filename layout.
+                data = {"files": {name: sha256 for sha256, name in data.items()}, "indexed": []}
+            index = _HashIndex(data["files"], data["indexed"])
+
+            try:
+                yield index
+            finally:
+                # Saved on errors too, so archive members stored before a
+                # failure stay tracked.
+                tmp_path = f"{index_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"files": index.files, "indexed": sorted(index.indexed)}, f)
+                os.replace(tmp_path, index_path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    """Points target at the same content as source, sharing the blocks when possible."""
+    tmp_path = f"{target}.{os.getpid()}.link"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def _store(stream: BinaryIO, filename: str, data_dir: str, max_bytes: int, index: _HashIndex) -> Dict:
+    path = safe_path(data_dir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    relative = os.path.relpath(path, data_dir)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir, prefix=".upload-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := stream.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{filename} exceeds the {max_bytes} byte limit")
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        sha256 = digest.hexdigest()
+        result = {"status": "uploaded", "filename": relative, "sha256": sha256, "size": size}
+        existing = index.existing(data_dir, sha256)
+        if existing:
+            os.remove(tmp_path)
+            if existing != relative:
+                _link_or_copy(os.path.join(data_dir, existing), path)
+            result.update({"status": "duplicate", "duplicate_of": existing})
+        else:
+            os.replace(tmp_path, path)
+        index.add(relative, sha256)
+        result["indexed"] = sha256 in index.indexed
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return result
+
+
+def store_stream(stream: BinaryIO, filename: str, data_dir: str, max_bytes: int = MAX_UPLOAD_BYTES) -> Dict:
+    """
+    Writes a stream into data_dir in chunks, hashing it on the fly.
+
+    Content that is already stored under another name is hard-linked instead of
+    written again and reported as a duplicate; every name stays a real file, so
+    overwriting or deleting one never affects the others. ``indexed`` tells
+    whether the content is already in the vector index. Raises UploadTooLarge
+    once max_bytes is exceeded.
+    """
+    with _hash_index(data_dir) as index:
+        return _store(stream, filename, data_dir, max_bytes, index)
+
+
+def forget_file(data_dir: str, filename: str) -> None:
+    """Drops a deleted file from the dedupe index."""
+    relative = os.path.relpath(safe_path(data_dir, filename), data_dir)
+    with _hash_index(data_dir) as index:
+        index.remove(relative)
+
+
+def set_indexed(data_dir: str, filenames: Iterable[str], replace: bool = False) -> None:
+    """
+    Records the content of the given stored names as indexed.
+
+    With replace the indexed set becomes exactly those names' content, for a
+    full rebuild of the vector index.
+    """
+    with _hash_index(data_dir) as index:
+        hashes = {index.files[name] for name in filenames if name in index.files}
+        if replace:
+            index.indexed = hashes
+        else:
+            index.indexed.update(hashes)
+
+
+def _seekable(stream: BinaryIO) -> BinaryIO:
+    """
+    Returns a file object zipfile can seek in.
+
+    SpooledTemporaryFile only gained seekable() in Python 3.11, so on older
+    versions the underlying BytesIO or temporary file is used instead.
+    """
+    if hasattr(stream, "seekable"):
+        return stream
+    return getattr(stream, "_file", stream)
+
+
+def _archive_members(stream: BinaryIO, filename: str) -> Iterator[tuple]:
+    """Yields (name, file object) for every regular file of a zip or tar archive."""
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(_seekable(stream)) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+        return
+
+    # "r|*" reads the tar sequentially, so the archive never has to be seekable.
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        for info in archive:
+            if info.isfile():
+                yield info.name, archive.extractfile(info)
+
+
+def expand_archive(stream: BinaryIO, filename: str, data_dir: str, extensions: Sequence[str],
+                   max_bytes: int = MAX_ARCHIVE_BYTES) -> List[Dict]:
+    """
+    Streams every supported member of a zip/tar archive into data_dir.
+
+    Members are hashed and deduplicated like single uploads, under a single
+    hold of the dedupe index that is saved once at the end. max_bytes bounds
+    the total expanded size.
+    """
+    results = []
+    remaining = max_bytes
+    try:
+        with _hash_index(data_dir) as index:
+            for name, member in _archive_members(stream, filename):
+                if not name.lower().endswith(tuple(extensions)):
+                    continue
+                try:
+                    result = _store(member, name, data_dir, min(remaining, MAX_UPLOAD_BYTES), index)
+                except UploadTooLarge:
+                    raise
+                except ValueError as e:
+                    results.append({"status": "skipped", "filename": name, "detail": str(e)})
+                    continue
+                remaining -= result["size"]
+                results.append(result)
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError, RuntimeError, NotImplementedError) as e:
+        # Corrupt, truncated, encrypted or unsupported archives.
+        raise ValueError(f"Invalid archive {filename}: {e}")
+    return results
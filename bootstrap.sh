@@ -14,5 +14,13 @@ else
     echo "[Bootstrap] $MODEL_NAME already installed."
 fi
 
-echo "[Bootstrap] Starting FastAPI server..."
-uvicorn main:app --host 0.0.0.0 --port 8000
+WORKERS="${WORKERS:-1}"
+
+echo "[Bootstrap] Starting FastAPI server with $WORKERS worker(s)..."
+if [ "$WORKERS" -gt 1 ]; then
+    # --preload loads the embedding model once in the master so forked workers
+    # share its pages; each worker attaches to the published index generation.
+    gunicorn main:app -k uvicorn.workers.UvicornWorker --workers "$WORKERS" --preload --bind 0.0.0.0:8000
+else
+    uvicorn main:app --host 0.0.0.0 --port 8000
+fi
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("langchain_core")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from chunking import StructuredChunker, split_blocks, whitespace_token_counter  # noqa: E402
+
+
+def kinds(text):
+    return [kind for kind, _, _ in split_blocks(text)]
+
+
+def test_numbered_list_item_is_not_a_heading():
+    text = "1. Install Docker\nRun the installer and reboot.\n"
+    chunks = StructuredChunker(chunk_tokens=50).split_text(text)
+
+    assert "heading" not in kinds(text)
+    assert [chunk["section"] for chunk in chunks] == [""]
+
+
+def test_multi_level_numbered_title_is_a_heading():
+    text = "3.1 Access Control\nAccounts are reviewed monthly.\n"
+    chunks = StructuredChunker(chunk_tokens=50).split_text(text)
+
+    assert kinds(text)[0] == "heading"
+    assert chunks[0]["section"] == "3.1 Access Control"
+
+
+def test_prose_with_double_spaces_is_not_a_table():
+    text = "This is a paragraph of text.  It has  two double spaces.\nAnd it goes on.  For a while  longer.\n"
+
+    assert "table" not in kinds(text)
+
+
+def test_space_aligned_rows_are_a_table():
+    text = "Name    Age    City\nBob     3      Paris\nAl      4      Rome\n"
+
+    assert kinds(text) == ["table"]
+
+
+def test_chunks_stay_within_budget():
+    text = "3.1 Access Control\n" + " ".join(f"word{i}" for i in range(200)) + ".\n"
+    chunks = StructuredChunker(chunk_tokens=20).split_text(text)
+
+    assert max(whitespace_token_counter(chunk["text"]) for chunk in chunks) <= 20
+
+
+def test_wide_header_leaves_room_for_records():
+    header = ", ".join(f"column{i}" for i in range(40))
+    rows = "\n".join(f"r{i}, v{i}" for i in range(10))
+    chunks = StructuredChunker(chunk_tokens=20).split_text(rows, records=True, header=header)
+
+    assert len(chunks) <= 5
+    assert all(whitespace_token_counter(chunk["text"]) <= 20 for chunk in chunks)